@@ -1,11 +1,31 @@
-import json
+import functools
+import re
 from abc import abstractmethod, ABC
 from dataclasses import dataclass, field
 
-from dacite import from_dict
+import msgspec
 
 
-@dataclass
+_PRICE_REGEX = re.compile(r'(\d[\d,]*)\s*(cp|sp|gp)')
+_CP_BY_DENOMINATION = {
+    'cp': 1,
+    'sp': 10,
+    'gp': 100
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def get_cost_in_cp(price: str) -> int:
+    # Format: '100 gp, 10 sp, 1 cp' or '100 gp', etc
+    if price == '':
+        return 0
+    return sum(
+        int(match.group(1).replace(',', '')) * _CP_BY_DENOMINATION[match.group(2)]
+        for match in _PRICE_REGEX.finditer(price)
+    )
+
+
+@dataclass(slots=True)
 class AonItemJson:
     name: str
     rarity: str
@@ -18,6 +38,10 @@ class AonItemJson:
     trait: list[str] = field(default_factory=list)
     markdown: str = ''
     item_subcategory: str = ''
+    price_cp: int = field(init=False, default=0)
+
+    def __post_init__(self) -> None:
+        self.price_cp = get_cost_in_cp(self.price_raw)
 
     def __hash__(self) -> int:
         return hash(self.id)
@@ -28,35 +52,40 @@ class AonItemJson:
 
 class AonItemLoader(ABC):
     @abstractmethod
-    def load_items_by_category(self, category: str) -> list[AonItemJson]:
+    def load_items_by_category(self, category: str) -> tuple[AonItemJson, ...]:
         pass
 
-    def load_items_by_categories(self, categories: list[str]) -> list[AonItemJson]:
-        items = []
-        for category in categories:
-            items.extend(self.load_items_by_category(category))
-        return items
+    def load_items_by_categories(self, categories: list[str]) -> tuple[AonItemJson, ...]:
+        return tuple(item for category in categories for item in self.load_items_by_category(category))
 
 
 class LocalFileAonItemLoader(AonItemLoader):
-    def load_items_by_category(self, category: str) -> list[AonItemJson]:
+    def load_items_by_category(self, category: str) -> tuple[AonItemJson, ...]:
+        try:
+            return load_items_by_category(category)
+        except FileNotFoundError as e:
+            print("File not found - AON data is likely not scraped. Run scrape_aon.py")
+            raise e
+
+    def load_items_by_categories(self, categories: list[str]) -> tuple[AonItemJson, ...]:
         try:
-            with open(f'aon-data/aon39/{category}.json') as f:
-                equipment = json.load(f)
-                return [from_dict(AonItemJson, item) for item in equipment]
+            return load_items_by_categories(categories)
         except FileNotFoundError as e:
             print("File not found - AON data is likely not scraped. Run scrape_aon.py")
             raise e
 
 
-def load_items_by_category(category: str) -> list[AonItemJson]:
-    with open(f'aon-data/aon39/{category}.json') as f:
-        equipment = json.load(f)
-        return [from_dict(AonItemJson, item) for item in equipment]
+# Loaded items are cached and shared between callers, so they must not be mutated
+@functools.lru_cache(maxsize=None)
+def load_items_by_category(category: str) -> tuple[AonItemJson, ...]:
+    with open(f'aon-data/aon39/{category}.json', 'rb') as f:
+        return tuple(msgspec.json.decode(f.read(), type=list[AonItemJson]))
+
+
+def load_items_by_categories(categories: list[str]) -> tuple[AonItemJson, ...]:
+    return _load_items_by_categories(tuple(categories))
 
 
-def load_items_by_categories(categories: list[str]) -> list[AonItemJson]:
-    items = []
-    for category in categories:
-        items.extend(load_items_by_category(category))
-    return items
+@functools.lru_cache(maxsize=None)
+def _load_items_by_categories(categories: tuple[str, ...]) -> tuple[AonItemJson, ...]:
+    return tuple(item for category in categories for item in load_items_by_category(category))
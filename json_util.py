@@ -0,0 +1,25 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def load_json_file(file_path: str) -> any:
+    if orjson is None:
+        with open(file_path) as f:
+            return json.load(f)
+
+    with open(file_path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def dump_json_file(data: any, file_path: str) -> None:
+    if orjson is None:
+        with open(file_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        return
+
+    with open(file_path, 'wb') as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
@@ -1,10 +1,30 @@
 import argparse
-import json
+import asyncio
 import os
-from collections import defaultdict
+from collections import defaultdict, deque
 from dataclasses import dataclass
+from typing import Callable
 
+import aiohttp
+import ijson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+from json_util import dump_json_file
+
+MAX_CONCURRENT_REQUESTS = 32
+
+
+def _create_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=Retry(total=3, backoff_factor=0.5))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_SESSION = _create_session()
 
 
 def main() -> None:
@@ -38,49 +58,42 @@ def parse_args() -> Args:
     return Args(args.version, retrieve_all_revisions)
 
 
-def get_all_aon_json_data_by_category_overwrite_old_revisions(version: str) -> dict[str, list[dict[str, any]]]:
+def get_all_aon_json_data_by_category_overwrite_old_revisions(indices: list[str]) -> dict[str, list[dict[str, any]]]:
     item_by_category_and_name: defaultdict[str, dict[str, dict[str, any]]] = defaultdict(dict)
 
-    for index in get_aon_pf2e_indices(version):
-        data = get_aon_json_data(index)
-        for item in data:
-            category = item['category']
+    def merge_items(items: list[dict[str, any]]) -> None:
+        for item in items:
+            item_by_name = item_by_category_and_name[item['category']]
             name = item['name']
 
-            item_by_name = item_by_category_and_name.setdefault(category, {})
-
-            if name not in item_by_name:
+            existing_item = item_by_name.get(name)
+            if existing_item is None or item['release_date'] > existing_item['release_date']:
                 item_by_name[name] = item
 
-            release_date = item['release_date']
-            existing_release_date = item_by_name[name]['release_date']
-            if release_date > existing_release_date:
-                item_by_name[name] = item
-
-    item_by_category: dict[str, list[dict[str, any]]] = {}
-    for category, items in item_by_category_and_name.items():
-        item_by_category[category] = list(items.values())
+    asyncio.run(merge_all_aon_json_data(indices, merge_items))
 
-    return item_by_category
+    return {category: list(item_by_name.values()) for category, item_by_name in item_by_category_and_name.items()}
 
 
-def get_all_aon_json_data_by_category_no_overwriting(version: str) -> dict[str, list[dict[str, any]]]:
+def get_all_aon_json_data_by_category_no_overwriting(indices: list[str]) -> dict[str, list[dict[str, any]]]:
     item_by_category: defaultdict[str, list[dict[str, any]]] = defaultdict(list)
 
-    for index in get_aon_pf2e_indices(version):
-        data = get_aon_json_data(index)
-        for item in data:
-            category = item['category']
-            item_by_category[category].append(item)
+    def add_items(items: list[dict[str, any]]) -> None:
+        for item in items:
+            item_by_category[item['category']].append(item)
+
+    asyncio.run(merge_all_aon_json_data(indices, add_items))
 
     return item_by_category
 
 
 def get_all_aon_json_data_by_category(version: str, retrieve_all_revisions: bool) -> dict[str, list[dict[str, any]]]:
+    indices = get_aon_pf2e_indices(version)
+
     if retrieve_all_revisions:
-        return get_all_aon_json_data_by_category_no_overwriting(version)
+        return get_all_aon_json_data_by_category_no_overwriting(indices)
     else:
-        return get_all_aon_json_data_by_category_overwrite_old_revisions(version)
+        return get_all_aon_json_data_by_category_overwrite_old_revisions(indices)
 
 
 def get_all_aon_json_data_and_save(version: str, retrieve_all_revisions: bool) -> None:
@@ -94,12 +107,11 @@ def get_all_aon_json_data_and_save(version: str, retrieve_all_revisions: bool) -
                                                                                           retrieve_all_revisions)
 
     for category, items in item_by_category.items():
-        with open(os.path.join(output_dir, f'{category}.json'), 'w') as f:
-            json.dump(items, f, indent=2)
+        dump_json_file(items, os.path.join(output_dir, f'{category}.json'))
 
 
 def get_json(url: str) -> any:
-    response = requests.get(url)
+    response = _SESSION.get(url, timeout=30)
     if response.status_code != 200:
         raise Exception(f"Failed to retrieve data from {url}. Response status: {response.status_code}")
     return response.json()
@@ -110,20 +122,52 @@ def get_aon_pf2e_indices(version: str) -> dict[str, list[str]]:
     return get_json(index_url)
 
 
-def get_aon_json_data(index_id: str) -> list[dict[str, any]]:
-    try:
-        print(f"Retrieving data from {index_id}")
-        url = f"https://elasticsearch.aonprd.com/json-data/{index_id}.json"
-        return get_json(url)
-    except Exception as e:
-        print(e)
-        return []
+async def get_aon_json_data(
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.Semaphore,
+    index_id: str
+) -> list[dict[str, any]] | None:
+    async with semaphore:
+        try:
+            print(f"Retrieving data from {index_id}")
+            url = f"https://elasticsearch.aonprd.com/json-data/{index_id}.json"
+            async with session.get(url) as response:
+                if response.status != 200:
+                    raise Exception(f"Failed to retrieve data from {url}. Response status: {response.status}")
+                return [item async for item in ijson.items(response.content, 'item', use_float=True)]
+        except Exception as e:
+            print(e)
+            return None
+
+
+async def merge_all_aon_json_data(
+    indices: list[str],
+    shard_handler: Callable[[list[dict[str, any]]], None]
+) -> None:
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    async with aiohttp.ClientSession() as session:
+        tasks = deque(asyncio.create_task(get_aon_json_data(session, semaphore, index)) for index in indices)
+        try:
+            # Shards are handed over in index order as soon as they are ready, and dropped once merged,
+            # so only shards that finish ahead of an earlier one are held in memory.
+            # Shards that failed part way through are skipped whole.
+            while tasks:
+                items = await tasks.popleft()
+                if items is not None:
+                    shard_handler(items)
+        finally:
+            for task in tasks:
+                task.cancel()
 
 
 def remove_files(output_dir: str) -> None:
-    if os.path.exists(output_dir):
-        for file in os.listdir(output_dir):
-            os.remove(os.path.join(output_dir, file)) if file.endswith('.json') else None
+    if not os.path.isdir(output_dir):
+        return
+
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith('.json'):
+                os.remove(entry.path)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,16 @@
 import argparse
-import json
+import asyncio
 import os
 from dataclasses import dataclass
+from pathlib import Path
 
-import requests
+import aiohttp
 
+from json_util import load_json_file
 from scrape_aon import get_all_aon_json_data_and_save
 
+MAX_CONCURRENT_DOWNLOADS = 64
+
 
 @dataclass(frozen=True)
 class Args:
@@ -21,7 +25,19 @@ def parse_args() -> Args:
 
 
 def list_all_files_in_dir(directory: str) -> list[str]:
-    return [os.path.join(directory, file) for file in os.listdir(directory)]
+    with os.scandir(directory) as entries:
+        return [entry.path for entry in entries]
+
+
+def list_all_files_in_dir_recursively(directory: str) -> set[str]:
+    files = set()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                files.update(list_all_files_in_dir_recursively(entry.path))
+            elif entry.is_file():
+                files.add(entry.path)
+    return files
 
 
 def scrape_all_images(aon_version: str) -> None:
@@ -33,15 +49,62 @@ def scrape_all_images(aon_version: str) -> None:
         get_all_aon_json_data_and_save(aon_version, False)
         json_files = list_all_json_files(output_dir)
 
+    asyncio.run(download_all_images(json_files, output_dir))
+
+
+async def download_all_images(json_files: list[str], output_dir: str) -> None:
+    queue: asyncio.Queue[tuple[dict[str, any], str] | None] = asyncio.Queue(maxsize=MAX_CONCURRENT_DOWNLOADS * 2)
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_DOWNLOADS)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        workers = [
+            asyncio.create_task(download_images_from_queue(session, queue, output_dir))
+            for _ in range(MAX_CONCURRENT_DOWNLOADS)
+        ]
+        producer = asyncio.create_task(queue_image_downloads(json_files, output_dir, queue, len(workers)))
+        try:
+            await asyncio.gather(producer, *workers)
+        finally:
+            for task in (producer, *workers):
+                task.cancel()
+
+
+async def queue_image_downloads(
+    json_files: list[str],
+    output_dir: str,
+    queue: asyncio.Queue[tuple[dict[str, any], str] | None],
+    worker_count: int
+) -> None:
+    existing_files = list_all_files_in_dir_recursively(output_dir)
     for file in json_files:
-        with open(file) as f:
-            data = json.load(f)
-            for item in data:
-                get_webp_file_and_save(item, output_dir)
+        data = await asyncio.to_thread(load_json_file, file)
+        for item in data:
+            for image_path in get_image_paths(item):
+                file_name = os.path.join(output_dir, image_path)
+                if file_name in existing_files:
+                    print(f'{file_name} already exists')
+                    continue
+                # Items can share images, so mark the file as taken to avoid downloading it twice
+                existing_files.add(file_name)
+                await queue.put((item, image_path))
+
+    # One stop marker per worker
+    for _ in range(worker_count):
+        await queue.put(None)
+
+
+async def download_images_from_queue(
+    session: aiohttp.ClientSession,
+    queue: asyncio.Queue[tuple[dict[str, any], str] | None],
+    output_dir: str
+) -> None:
+    while (download := await queue.get()) is not None:
+        aon_entity, image_path = download
+        await download_image(session, aon_entity, image_path, output_dir)
 
 
 def list_all_json_files(output_dir):
-    return [os.path.join(output_dir, file) for file in os.listdir(output_dir) if file.endswith('.json')]
+    with os.scandir(output_dir) as entries:
+        return [entry.path for entry in entries if entry.is_file() and entry.name.endswith('.json')]
 
 
 def main():
@@ -62,39 +125,41 @@ def make_dir_if_not_exists(file_path: str) -> None:
         directory_cache.add(file_path)
 
 
-def get_webp_file_and_save(aon_entity: dict[str, any], output_dir: str) -> None:
+def get_image_paths(aon_entity: dict[str, any]) -> list[str]:
     if 'image' not in aon_entity:
-        return
+        return []
 
     image_paths: list[str] = aon_entity['image']
-
-    for image_path in image_paths:
-        if image_path.startswith('/'):
-            image_path = image_path[1:]
-
-        file_name = os.path.join(output_dir, image_path)
-        file_path_without_file_name = '/'.join(file_name.split('/')[:-1])
-
-        if os.path.exists(file_name):
-            print(f'{file_name} already exists')
-            return
-
-        make_dir_if_not_exists(file_path_without_file_name)
-
-        creature_name = aon_entity['name']
-
-        url = f'https://2e.aonprd.com/{image_path}'
-        response = requests.get(url)
-        print(f'Downloaded {creature_name} from {url}')
-
-        if response.status_code == 200:
-            with open(file_name, 'wb') as f:
-                f.write(response.content)
-        elif response.status_code == 404:
-            print(f'{image_path} does not exist')
-        else:
-            print(f'Failed to download {creature_name} with status code {response.status_code}')
-
+    return [image_path[1:] if image_path.startswith('/') else image_path for image_path in image_paths]
+
+
+async def download_image(
+    session: aiohttp.ClientSession,
+    aon_entity: dict[str, any],
+    image_path: str,
+    output_dir: str
+) -> None:
+    file_name = os.path.join(output_dir, image_path)
+    file_path_without_file_name = '/'.join(file_name.split('/')[:-1])
+
+    make_dir_if_not_exists(file_path_without_file_name)
+
+    creature_name = aon_entity['name']
+
+    url = f'https://2e.aonprd.com/{image_path}'
+    try:
+        async with session.get(url) as response:
+            print(f'Downloaded {creature_name} from {url}')
+
+            if response.status == 200:
+                data = await response.read()
+                await asyncio.to_thread(Path(file_name).write_bytes, data)
+            elif response.status == 404:
+                print(f'{image_path} does not exist')
+            else:
+                print(f'Failed to download {creature_name} with status code {response.status}')
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f'Failed to download {creature_name} from {url}: {e!r}')
 
 if __name__ == '__main__':
     main()
@@ -1,14 +1,16 @@
+import functools
+import itertools
 import random
 import re
 from abc import abstractmethod, ABC
 from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import Callable
+from typing import Iterator, Sequence
 
 from aon_item_loader import AonItemJson, AonItemLoader
 
 
-@dataclass
+@dataclass(slots=True)
 class ItemOutputData:
     name: str
     rarity: str
@@ -18,26 +20,27 @@ class ItemOutputData:
     markdown: str | None = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ItemTypeData:
     potency_name: str
     strength_name: str
     amount: int
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class LevelRequest:
-    weights: dict[int, float] = field(default_factory=dict)
+    # Weight per item level, indexed by level; levels weighted 0 are never chosen
+    weights: Sequence[float] = ()
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TraitRequest:
     required_traits: list[str] = field(default_factory=list)
     exclude_traits: list[str] = field(default_factory=list)
     categories: list[str] = field(default_factory=lambda: ['equipment'])
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class RarityRequest:
     common_number: int
     uncommon_number: int
@@ -45,27 +48,27 @@ class RarityRequest:
     unique_number: int
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class EquipmentSearchRequest:
     rarity_request: RarityRequest
     traits: TraitRequest
     level_request: LevelRequest
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ItemWithRunesSearchRequest:
     level_request: LevelRequest
     weapons: int
     armor: int
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class GeneralSearchRequest:
     equipment_search_request: EquipmentSearchRequest | None
     item_with_runes_search_request: ItemWithRunesSearchRequest | None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class _ItemWithRunes:
     item: AonItemJson
     potency: AonItemJson | None
@@ -73,13 +76,17 @@ class _ItemWithRunes:
     item_type_data: ItemTypeData
     property_runes: list[AonItemJson] = field(default_factory=list)
 
-    def __get_all_as_list(self) -> list[AonItemJson]:
-        l = [self.item, self.potency, self.strength, *self.property_runes]
-        return [item for item in l if item is not None]
+    def __iter_all(self) -> Iterator[AonItemJson]:
+        yield self.item
+        if self.potency is not None:
+            yield self.potency
+        if self.strength is not None:
+            yield self.strength
+        yield from self.property_runes
 
     def get_gp_cost(self) -> str:
         # Ex: '100 gp, 10 sp, 1 cp' or '100 gp', etc
-        cost = sum([_get_cost_in_cp(item.price_raw) for item in self.__get_all_as_list()])
+        cost = sum(item.price_cp for item in self.__iter_all())
         gp_cost = int(cost / 100)
         sp_cost = int((cost % 100) / 10)
         cp_cost = cost % 10
@@ -91,7 +98,7 @@ class _ItemWithRunes:
         return cost
 
     def get_level(self) -> int:
-        return max([item.level if item is not None else 0 for item in self.__get_all_as_list()])
+        return max((item.level for item in self.__iter_all()), default=0)
 
     def get_potency_modifier_str(self) -> str:
         return (_get_item_potency_by_name(self.potency.name) + ' ') if self.potency else ''
@@ -108,13 +115,12 @@ class _ItemWithRunes:
         return f'{self.get_potency_modifier_str()}{self.get_strength_modifier_str()}{self.get_property_runes_str()}{self.item.name}'
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class RunesInfo:
     item_potency_level_to_item: dict[int, list[AonItemJson]]
     item_strength_level_to_item: dict[int, list[AonItemJson]]
     item_property_runes_level_to_items: dict[int, list[AonItemJson]]
-    items: list[AonItemJson]
-    item_type_data: ItemTypeData
+    items: tuple[AonItemJson, ...]
 
 
 class ISearchService(ABC):
@@ -129,27 +135,28 @@ def _to_item_output_data(item: AonItemJson) -> ItemOutputData:
         rarity=item.rarity,
         level=item.level,
         price_raw=item.price_raw,
-        url=item.url,
+        url=item.url if item.url.startswith('http') else f"https://2e.aonprd.com{item.url}",
         markdown=item.markdown
     )
 
 
-def _find_names_in_markdown(markdown: str) -> list[str]:
-    markdown = markdown.replace('\n', '')
-    markdown = markdown.replace('\r', '')
-    regex = r'<title[\s\S]*?right="Item\s\d+"[\s\S]*?>(.*?)<\/title>'
-    match = re.search(regex, markdown)
+_TITLE_REGEX = re.compile(r'<title[\s\S]*?right="Item\s\d+"[\s\S]*?>(.*?)<\/title>', re.DOTALL)
+_PRICE_MARKDOWN_REGEX = re.compile(r"\*\*Price\*\* (\d+ gp)(?: (\d+sp))?(?: (\d+cp))?")
+
+
+@functools.lru_cache(maxsize=1024)
+def _find_names_in_markdown(markdown: str) -> tuple[str, ...]:
+    match = _TITLE_REGEX.search(markdown)
     if match is None:
-        return []
-    return list(map(str.strip, match.groups()))
+        return ()
+    return tuple(name.replace('\n', '').replace('\r', '').strip() for name in match.groups())
 
 
 def _parse_aon_price(aon_item_json: ItemOutputData) -> str:
     if aon_item_json.price_raw != '':
         return aon_item_json.price_raw
 
-    regex = r"\*\*Price\*\* (\d+ gp)(?: (\d+sp))?(?: (\d+cp))?"
-    match = re.search(regex, aon_item_json.markdown)
+    match = _PRICE_MARKDOWN_REGEX.search(aon_item_json.markdown)
     if match is None:
         return ''
 
@@ -164,21 +171,30 @@ def _parse_aon_price(aon_item_json: ItemOutputData) -> str:
 
 def _fix_aon_price(items: list[ItemOutputData]) -> None:
     for item in items:
-        if item.markdown is not None:
-            price = _parse_aon_price(item)
-            if 'Price' in price:
-                price = ' '.join(price.split(' ')[1:])
-            item.price_raw = price
+        if item.markdown is None or item.price_raw != '':
+            continue
 
-
-def first(flter: Callable[[any], bool], iterable: list[any]) -> any:
-    return next(item for item in iterable if flter(item))
+        price = _parse_aon_price(item)
+        if 'Price' in price:
+            price = ' '.join(price.split(' ')[1:])
+        item.price_raw = price
 
 
 @dataclass(frozen=True)
 class AonSearchService(ISearchService):
     aon_item_loader: AonItemLoader
-    sources: list[str]
+    sources: frozenset[str]
+    rng: random.Random = field(default_factory=random.Random, compare=False)
+    _items_by_rarity_by_level_cache: dict[
+        tuple[tuple[str, ...], frozenset[str], frozenset[str]],
+        dict[str, dict[int, list[AonItemJson]]]
+    ] = field(default_factory=dict, init=False, repr=False, compare=False)
+    _runes_info_cache: dict[tuple[str, str], RunesInfo] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # Callers may pass any iterable of source names; filtering needs set operations
+        object.__setattr__(self, 'sources', frozenset(self.sources))
 
     def get_random_items_by_request(self, general_search_request: GeneralSearchRequest) -> list[ItemOutputData]:
         result = []
@@ -195,34 +211,68 @@ class AonSearchService(ISearchService):
         return result
 
     def _get_random_equipment(self, search_request: EquipmentSearchRequest) -> list[ItemOutputData]:
-        equipment = self.aon_item_loader.load_items_by_categories(search_request.traits.categories)
-        items = [item for item in equipment if _any_from_list_is_in_list(item.source, self.sources)]
-        items = [item for item in items if
-                 len(search_request.traits.required_traits) == 0 or _any_from_list_is_in_list(
-                     item.trait, search_request.traits.required_traits)]
-        items = [item for item in items if
-                 not _any_from_list_is_in_list(item.trait, search_request.traits.exclude_traits)]
-
-        for item in items:
-            item.url = f"https://2e.aonprd.com{item.url}"
-
-        items = _choose_items_by_level_and_rarity(items, search_request)
+        items_by_rarity_by_level = self._get_items_by_rarity_by_level(
+            tuple(search_request.traits.categories),
+            frozenset(search_request.traits.required_traits),
+            frozenset(search_request.traits.exclude_traits)
+        )
+
+        items = _choose_items_by_level_and_rarity(items_by_rarity_by_level, search_request, self.rng)
         return [_to_item_output_data(item) for item in items if item is not None]
 
-    def _get_runes_info(self, item_type_data: ItemTypeData) -> RunesInfo:
+    def _get_items_by_rarity_by_level(
+        self,
+        categories: tuple[str, ...],
+        required_traits: frozenset[str],
+        exclude_traits: frozenset[str]
+    ) -> dict[str, dict[int, list[AonItemJson]]]:
+        key = (categories, required_traits, exclude_traits)
+        items_by_rarity_by_level = self._items_by_rarity_by_level_cache.get(key)
+        if items_by_rarity_by_level is None:
+            items_by_rarity_by_level = self._build_items_by_rarity_by_level(*key)
+            self._items_by_rarity_by_level_cache[key] = items_by_rarity_by_level
+
+        return items_by_rarity_by_level
+
+    def _build_items_by_rarity_by_level(
+        self,
+        categories: tuple[str, ...],
+        required_traits: frozenset[str],
+        exclude_traits: frozenset[str]
+    ) -> dict[str, dict[int, list[AonItemJson]]]:
+        equipment = self.aon_item_loader.load_items_by_categories(list(categories))
+        items = [
+            item for item in equipment
+            if (not required_traits or not required_traits.isdisjoint(item.trait))
+            and not self.sources.isdisjoint(item.source)
+            and exclude_traits.isdisjoint(item.trait)
+        ]
+
+        return _build_rarity_level_index(items)
+
+    def _get_runes_info(self, potency_name: str, strength_name: str) -> RunesInfo:
+        key = (potency_name, strength_name)
+        runes_info = self._runes_info_cache.get(key)
+        if runes_info is None:
+            runes_info = self._build_runes_info(potency_name, strength_name)
+            self._runes_info_cache[key] = runes_info
+
+        return runes_info
+
+    def _build_runes_info(self, potency_name: str, strength_name: str) -> RunesInfo:
         equipment = self.aon_item_loader.load_items_by_category('equipment')
-        weapons = self.aon_item_loader.load_items_by_category(item_type_data.potency_name.lower())
+        weapons = self.aon_item_loader.load_items_by_category(potency_name.lower())
+        equipment_by_name = {item.name: item for item in equipment}
 
-        potency_postfixes = [f'{item_type_data.potency_name} Potency (+{i})' for i in range(1, 4)]
+        potency_postfixes = [f'{potency_name} Potency (+{i})' for i in range(1, 4)]
 
         get_striking_name_by_rank = lambda \
-            postfix: f'{item_type_data.strength_name}{f' ({postfix})' if postfix is not None else ''}'
+            postfix: f'{strength_name}{f' ({postfix})' if postfix is not None else ''}'
         rank_postfix = [None, 'Greater', 'Major']
         strength_postfixes = list(map(get_striking_name_by_rank, rank_postfix))
 
-
-        item_potency = [first(lambda item: item.name == postfix, equipment) for postfix in potency_postfixes]
-        item_strength = [first(lambda item: item.name == postfix, equipment) for postfix in strength_postfixes]
+        item_potency = [equipment_by_name[postfix] for postfix in potency_postfixes]
+        item_strength = [equipment_by_name[postfix] for postfix in strength_postfixes]
 
         item_potency_level_to_item: dict[int, list[AonItemJson]] = {0: []}
         for item in item_potency:
@@ -232,21 +282,19 @@ class AonSearchService(ISearchService):
         for item in item_strength:
             item_striking_level_to_item[item.level] = [item]
 
-        item_property_runes = [item for item in equipment if
-                               item.item_subcategory == f'{item_type_data.potency_name} Property Runes']
-
+        property_runes_subcategory = f'{potency_name} Property Runes'
         item_property_runes_level_to_items: dict[int, list[AonItemJson]] = defaultdict(list)
         item_property_runes_level_to_items[0].append(None)
 
-        for item in item_property_runes:
-            item_property_runes_level_to_items[item.level].append(item)
+        for item in equipment:
+            if item.item_subcategory == property_runes_subcategory:
+                item_property_runes_level_to_items[item.level].append(item)
 
         return RunesInfo(
             item_potency_level_to_item,
             item_striking_level_to_item,
             item_property_runes_level_to_items,
-            weapons,
-            item_type_data
+            weapons
         )
 
     def _generate_items_with_runes(
@@ -254,8 +302,12 @@ class AonSearchService(ISearchService):
         item_type_data: ItemTypeData,
         search_request: ItemWithRunesSearchRequest
     ) -> list[ItemOutputData]:
-        runes_info = self._get_runes_info(item_type_data)
-        return [_get_random_item_with_runes(runes_info, search_request) for _ in range(item_type_data.amount)]
+        runes_info = self._get_runes_info(item_type_data.potency_name, item_type_data.strength_name)
+        runes_distribution = _prepare_runes_distribution(runes_info, search_request.level_request)
+        return [
+            _get_random_item_with_runes(runes_info, runes_distribution, item_type_data, self.rng)
+            for _ in range(item_type_data.amount)
+        ]
 
     def _generate_armor_runes_based_on_request(self, search_request: ItemWithRunesSearchRequest) -> list[
         ItemOutputData]:
@@ -272,25 +324,88 @@ class AonSearchService(ISearchService):
         )
 
 
-def _get_random_item_with_runes(runes_info: RunesInfo, search_request: ItemWithRunesSearchRequest) -> ItemOutputData:
-    item_potency_rune = _get_random_item(runes_info.item_potency_level_to_item, search_request.level_request)
-    potency_rank = int(_get_item_potency_by_name(item_potency_rune.name)) if item_potency_rune is not None else 0
-    item_strength_rune = _get_random_item(runes_info.item_strength_level_to_item, search_request.level_request)
+@dataclass(frozen=True, slots=True)
+class _LevelDistribution:
+    levels: list[int]
+    cumulative_weights: list[float]
+
+
+def _prepare_level_distribution(
+    items_by_level: dict[int, list[AonItemJson]],
+    level_request: LevelRequest
+) -> _LevelDistribution | None:
+    levels = [level for level, weight in enumerate(level_request.weights) if weight > 0 and level in items_by_level]
+    if len(levels) == 0:
+        return None
+
+    weights = [level_request.weights[level] for level in levels]
+    return _LevelDistribution(levels, list(itertools.accumulate(weights)))
+
+
+def _sample_item(
+    distribution: _LevelDistribution | None,
+    items_by_level: dict[int, list[AonItemJson]],
+    rng: random.Random
+) -> AonItemJson | None:
+    return _sample_items(distribution, items_by_level, 1, rng)[0]
+
+
+def _sample_items(
+    distribution: _LevelDistribution | None,
+    items_by_level: dict[int, list[AonItemJson]],
+    number: int,
+    rng: random.Random
+) -> list[AonItemJson | None]:
+    if distribution is None:
+        return [None] * number
+
+    levels = rng.choices(distribution.levels, cum_weights=distribution.cumulative_weights, k=number)
+    return [
+        rng.choice(items_to_choose) if len(items_to_choose := items_by_level[level]) > 0 else None
+        for level in levels
+    ]
+
+
+@dataclass(frozen=True, slots=True)
+class _RunesDistribution:
+    potency: _LevelDistribution | None
+    strength: _LevelDistribution | None
+    property_runes: _LevelDistribution | None
+
+
+def _prepare_runes_distribution(runes_info: RunesInfo, level_request: LevelRequest) -> _RunesDistribution:
+    return _RunesDistribution(
+        potency=_prepare_level_distribution(runes_info.item_potency_level_to_item, level_request),
+        strength=_prepare_level_distribution(runes_info.item_strength_level_to_item, level_request),
+        property_runes=_prepare_level_distribution(runes_info.item_property_runes_level_to_items, level_request)
+    )
+
+
+def _get_random_item_with_runes(
+    runes_info: RunesInfo,
+    runes_distribution: _RunesDistribution,
+    item_type_data: ItemTypeData,
+    rng: random.Random
+) -> ItemOutputData:
+    item_potency_rune = _sample_item(runes_distribution.potency, runes_info.item_potency_level_to_item, rng)
+    potency_rank = _get_item_potency_rank(item_potency_rune.name) if item_potency_rune is not None else 0
+    item_strength_rune = _sample_item(runes_distribution.strength, runes_info.item_strength_level_to_item, rng)
 
     item_property_runes_i = [
-        rune for _ in range(random.randrange(0, potency_rank + 1))
+        rune for _ in range(rng.randrange(0, potency_rank + 1))
         if
-        (rune := _get_random_item(
+        (rune := _sample_item(
+            runes_distribution.property_runes,
             runes_info.item_property_runes_level_to_items,
-            search_request.level_request)) is not None
+            rng)) is not None
     ]
 
     weapon_with_runes = _ItemWithRunes(
-        item=random.choice(runes_info.items),
+        item=rng.choice(runes_info.items),
         potency=item_potency_rune,
         strength=item_strength_rune,
         property_runes=item_property_runes_i,
-        item_type_data=runes_info.item_type_data
+        item_type_data=item_type_data
     )
 
     return ItemOutputData(
@@ -301,44 +416,26 @@ def _get_random_item_with_runes(runes_info: RunesInfo, search_request: ItemWithR
     )
 
 
-def _get_random_item(
-    items_by_level: dict[int, list[AonItemJson]],
-    level_request: LevelRequest
-) -> AonItemJson | None:
-    level_to_weight = level_request.weights.copy()
-    for weight in level_request.weights:
-        if weight not in items_by_level:
-            level_to_weight.pop(weight)
+def _build_rarity_level_index(items: list[AonItemJson]) -> dict[str, dict[int, list[AonItemJson]]]:
+    items_by_rarity_by_level: dict[str, dict[int, list[AonItemJson]]] = {}
 
-    if len(level_to_weight) == 0 or len(items_by_level) == 0:
-        return None
+    for item in items:
+        items_by_rarity_by_level.setdefault(item.rarity, {}).setdefault(item.level, []).append(item)
 
-    levels_to_choose = list(level_to_weight.keys())
-    weights = list(level_to_weight.values())
-    level = random.choices(levels_to_choose, weights=weights)[0]
-    items_to_choose = items_by_level[level]
-    return random.choice(items_to_choose) if len(items_to_choose) > 0 else None
+    return items_by_rarity_by_level
 
 
 def _choose_items_by_level_and_rarity(
-    items: list[AonItemJson],
-    search_request: EquipmentSearchRequest
+    items_by_rarity_by_level: dict[str, dict[int, list[AonItemJson]]],
+    search_request: EquipmentSearchRequest,
+    rng: random.Random
 ) -> list[AonItemJson]:
-    items_by_rarity_by_level: dict[str, dict[int, list[AonItemJson]]] = defaultdict(lambda: defaultdict(list))
-
-    for item in items:
-        level = item.level
-        rarity = item.rarity
-        items_by_level = items_by_rarity_by_level[rarity]
-        items_by_level[level].append(item)
-
     final_items = []
 
     def get_random_items(rarity: str, number: int) -> list[AonItemJson]:
-        return [
-            _get_random_item(items_by_rarity_by_level[rarity], search_request.level_request)
-            for _ in range(number)
-        ]
+        items_by_level = items_by_rarity_by_level.get(rarity, {})
+        distribution = _prepare_level_distribution(items_by_level, search_request.level_request)
+        return _sample_items(distribution, items_by_level, number, rng)
 
     final_items.extend(get_random_items('common', search_request.rarity_request.common_number))
     final_items.extend(get_random_items('uncommon', search_request.rarity_request.uncommon_number))
@@ -348,34 +445,23 @@ def _choose_items_by_level_and_rarity(
     return final_items
 
 
+@functools.lru_cache(maxsize=None)
 def _get_item_potency_by_name(name: str) -> str:
-    return name.split(' ')[-1][1:3]
+    return name.rpartition(' ')[2][1:3]
 
 
-def _get_cost_in_cp(price: str) -> int:
-    mappings = {
-        'cp': 1,
-        'sp': 10,
-        'gp': 100
-    }
+@functools.lru_cache(maxsize=None)
+def _get_item_potency_rank(name: str) -> int:
+    return int(_get_item_potency_by_name(name))
 
-    # Format: '100 gp, 10 sp, 1 cp' or '100 gp', etc
-    if price == '':
-        return 0
-    price_split = price.split(', ')
-    return sum([int(price_split[i].split(' ')[0].replace(',', '')) * mappings[price_split[i].split(' ')[1]] for i in
-                range(len(price_split))])
 
+_STRENGTH_RANKS = ('Greater', 'Major')
 
-def _get_item_strength_by_name(name: str, postfix="Striking") -> str:
-    if 'Greater' in name:
-        return f'Greater {postfix}'
 
-    if 'Major' in name:
-        return f'Major {postfix}'
+@functools.lru_cache(maxsize=None)
+def _get_item_strength_by_name(name: str, postfix="Striking") -> str:
+    for rank in _STRENGTH_RANKS:
+        if rank in name:
+            return f'{rank} {postfix}'
 
     return postfix
-
-
-def _any_from_list_is_in_list(list1: list[str], list2: list[str]) -> bool:
-    return any(item in list1 for item in list2)
@@ -1,40 +1,50 @@
 import argparse
+import dataclasses
+import functools
 import math
+import operator
 from dataclasses import dataclass
 from enum import Enum
-
-import pandas as pd
+from typing import Callable
 
 from aon_item_loader import LocalFileAonItemLoader
 from search_service import TraitRequest, RarityRequest, EquipmentSearchRequest, LevelRequest, \
     ItemWithRunesSearchRequest, AonSearchService, GeneralSearchRequest, ISearchService, ItemOutputData
 
 
+SOURCES = frozenset([
+    "Treasure Vault",
+    "GM Core",
+    "Player Core",
+    "Monster Core",
+    "Secrets of Magic",
+    "Rage of Elements",
+    "Guns & Gears",
+    "Gods & Magic",
+    "Book of the Dead",
+    "Grand Bazaar"
+])
+
+
+@functools.cache
+def _get_search_service() -> ISearchService:
+    return AonSearchService(LocalFileAonItemLoader(), SOURCES)
+
+
 def main():
     shop_request = parse_args()
-    sources = [
-        "Treasure Vault",
-        "GM Core",
-        "Player Core",
-        "Monster Core",
-        "Secrets of Magic",
-        "Rage of Elements",
-        "Guns & Gears",
-        "Gods & Magic",
-        "Book of the Dead",
-        "Grand Bazaar"
-    ]
-
-    search_service: ISearchService = AonSearchService(LocalFileAonItemLoader(), sources)
+    search_service = _get_search_service()
     search_request = create_search_request(shop_request)
     items = search_service.get_random_items_by_request(search_request)
 
     fields = ['name', 'rarity', 'level', 'source', 'price_raw', 'url']
 
+    rows = _collect_rows(items, fields)
+
     if shop_request.html:
-        print(_to_html_table_str(items, fields))
+        print(_to_html_table_str(rows, fields))
 
-    print(_display_as_table_str(items, fields))
+    print(_display_as_table_str(rows, fields))
 
     if shop_request.create_shopkeeper:
         print(create_zany_shopkeeper(items))
@@ -54,17 +64,17 @@ class ShopType(Enum):
         return self == ShopType.WEAPON or self == ShopType.ARMOR
 
 
-@dataclass
+@dataclass(slots=True)
 class EquipmentShopInfo:
     traits_by_shop_type: TraitRequest
 
 
-@dataclass
+@dataclass(slots=True)
 class ItemWithRunesShopInfo:
     weapon_to_armor_proportion: float = 0.5
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Shop:
     equipment_shop_info: EquipmentShopInfo | None = None
     item_with_runes_shop_info: ItemWithRunesShopInfo | None = None
@@ -119,7 +129,7 @@ shop_by_shop_type = {
 }
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ShopRequest:
     shop_type: ShopType
     level: int
@@ -139,7 +149,8 @@ traits_by_shop_type: dict[ShopType, TraitRequest] = {
 }
 
 
-def parse_args() -> ShopRequest:
+@functools.cache
+def _get_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description='Scrape images from Archives of Nethys')
     parser.add_argument(
         '--type',
@@ -160,7 +171,11 @@ def parse_args() -> ShopRequest:
     parser.add_argument('--no_html', help='Disable html output', action=argparse.BooleanOptionalAction)
     parser.add_argument('--shopkeeper', help='Create a zany shopkeeper', action=argparse.BooleanOptionalAction)
 
-    args = parser.parse_args()
+    return parser
+
+
+def parse_args() -> ShopRequest:
+    args = _get_parser().parse_args()
 
     return ShopRequest(
         shop_type=ShopType(args.type),
@@ -205,27 +220,31 @@ def create_search_request(shop_request: ShopRequest) -> GeneralSearchRequest:
     return GeneralSearchRequest(equipment_search_request, item_with_runes_search_request)
 
 
-def _display_as_table_str(items: list[ItemOutputData], fields: list[str]) -> str:
-    return _to_table_str(items, fields)
+def _display_as_table_str(rows: list[list[any]], fields: list[str]) -> str:
+    return _to_table_str(rows, fields)
+
 
+@functools.lru_cache(maxsize=256)
+def _generate_shop_item_weights(shop_level, max_level=30, decay=0.5) -> tuple[float, ...]:
+    weights = [0.0] * (max_level + 1)
 
-def _generate_shop_item_weights(shop_level, max_level=30, decay=0.5) -> dict[int, float]:
-    weights = {}
+    # exp(-decay * (shop_level - level)) as a geometric progression, walking down from shop_level
+    base = math.exp((-1) * decay)
+    weight = base ** max(shop_level - max_level, 0)
+    for level in range(min(shop_level, max_level), -1, -1):
+        weights[level] = weight
+        weight *= base
 
-    for level in range(max_level + 1):
-        if level <= shop_level:
-            weights[level] = math.exp((-1) * decay * (shop_level - level))
-        elif level == shop_level + 1:
-            weights[level] = 0.2
-        elif level == shop_level + 2:
-            weights[level] = 0.05
+    for level, weight in ((shop_level + 1, 0.2), (shop_level + 2, 0.05)):
+        if 0 <= level <= max_level:
+            weights[level] = weight
 
-    return weights
+    return tuple(weights)
 
 
 def create_zany_shopkeeper(aon_items: list[ItemOutputData]) -> str:
     import json
-    json_str = json.dumps([item.__dict__ for item in aon_items])
+    json_str = json.dumps([dataclasses.asdict(item) for item in aon_items])
 
     from openai import OpenAI
     client = OpenAI(
@@ -241,44 +260,66 @@ def create_zany_shopkeeper(aon_items: list[ItemOutputData]) -> str:
     return chat_completion.choices[0].message.content
 
 
-def _to_table_str(items: list[ItemOutputData], keys: list[str]) -> str:
-    data = [{key: getattr(item, key, "") for key in keys} for item in items]
-    df = pd.DataFrame(data, columns=keys)
-    return df.to_string(index=False)
+_ITEM_OUTPUT_DATA_FIELDS = frozenset(field.name for field in dataclasses.fields(ItemOutputData))
+
 
+def _get_empty_value(item: ItemOutputData) -> str:
+    return ''
 
-def _to_html_table_str(items: list[ItemOutputData], keys: list[str]) -> str:
+
+def _item_value_getters(keys: list[str]) -> list[Callable[[ItemOutputData], any]]:
+    # Keys that ItemOutputData does not define are rendered as empty cells
+    return [operator.attrgetter(key) if key in _ITEM_OUTPUT_DATA_FIELDS else _get_empty_value for key in keys]
+
+
+def _collect_rows(items: list[ItemOutputData], keys: list[str]) -> list[list[any]]:
+    getters = _item_value_getters(keys)
+    return [[getter(item) for getter in getters] for item in items]
+
+
+def _to_table_str(rows: list[list[any]], keys: list[str]) -> str:
+    columns = [[str(row[i]) for row in rows] for i in range(len(keys))]
+    widths = [max(len(key), max(map(len, column), default=0)) for key, column in zip(keys, columns)]
+
+    lines = [' '.join(key.rjust(width) for key, width in zip(keys, widths))]
+    lines.extend(' '.join(value.rjust(width) for value, width in zip(row, widths)) for row in zip(*columns))
+    return '\n'.join(lines)
+
+
+_HTML_ESCAPE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'})
+
+
+def _to_html_table_str(rows: list[list[any]], keys: list[str]) -> str:
     # Create the opening HTML table tag
     html = ['<table border="1">', '<thead><tr>']
 
-    use_linked_name = False
-
-    keys = keys.copy()
-    if 'name' in keys and 'url' in keys:
-        use_linked_name = True
-        keys.remove('url')
-        keys.remove('name')
+    use_linked_name = 'name' in keys and 'url' in keys
+    name_index = keys.index('name') if use_linked_name else None
+    url_index = keys.index('url') if use_linked_name else None
+    value_indices = [i for i in range(len(keys)) if i != name_index and i != url_index]
 
     # Create the table header row
     if use_linked_name:
         html.append('<th>Name</th>')
 
-    for key in keys:
-        html.append(f'<th>{key.capitalize()}</th>')
+    for i in value_indices:
+        html.append(f'<th>{keys[i].capitalize()}</th>')
 
     html.append('</tr></thead>')
 
     # Create the table body with rows for each item
     html.append('<tbody>')
-    for item in items:
-        row = '<tr>'
-        if use_linked_name:
-            row += f'<td><a href="{item.url}">{item.name}</a></td>'
-        for key in keys:
-            value = getattr(item, key, '')  # Get attribute value or empty string if missing
-            row += f'<td>{value}</td>'
-        row += '</tr>'
-        html.append(row)
+    html.extend(
+        ''.join((
+            '<tr>',
+            f'<td><a href="{str(row[url_index]).translate(_HTML_ESCAPE)}">'
+            f'{str(row[name_index]).translate(_HTML_ESCAPE)}</a></td>'
+            if use_linked_name else '',
+            *(f'<td>{str(row[i]).translate(_HTML_ESCAPE)}</td>' for i in value_indices),
+            '</tr>'
+        ))
+        for row in rows
+    )
     html.append('</tbody>')
 
     # Close the HTML table tag